@@ -3,9 +3,11 @@ Web Service Module
 Handles fetching content from URLs.
 """
 import re
+import threading
 import requests
 from bs4 import BeautifulSoup
 from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound, TranscriptsDisabled
+from services.cache_service import MemoryCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -16,9 +18,19 @@ class WebService:
 
     _URL_PATTERN = re.compile(r'https?://\S+')
     _YOUTUBE_PATTERN = re.compile(r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
+    _MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+    _HTML_TYPES = frozenset({'text/html', 'application/xhtml+xml'})
+    _PLAIN_TEXT_TYPES = frozenset({'text/plain', 'application/json'})
 
-    def __init__(self, timeout: int = 10):
+    def __init__(self, timeout: int = 10, cache_size: int = 256, cache_ttl: int = 300,
+                 max_content_length: int = 5 * 1024 * 1024):
         self.timeout = timeout
+        self.max_content_length = max_content_length
+        self.cache_ttl = cache_ttl
+        # 熱門網址直接由記憶體回傳，省去 DNS/TCP/TLS 與 HTML 解析
+        self._cache = MemoryCache(max_size=cache_size)
+        # MemoryCache 本身沒有鎖，fetch_url_content 會在多個執行緒中同時呼叫
+        self._cache_lock = threading.Lock()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
@@ -31,20 +43,61 @@ class WebService:
         """Checks if the given text is a YouTube URL."""
         return self._YOUTUBE_PATTERN.match(text) is not None
 
+    def _cache_ttl(self, response: requests.Response) -> int:
+        """
+        Determines how long a response may be cached, honoring Cache-Control.
+        Returns 0 when the response must not be cached.
+        """
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'no-cache' in cache_control:
+            return 0
+        max_age = self._MAX_AGE_PATTERN.search(cache_control)
+        if max_age:
+            return min(int(max_age.group(1)), self.cache_ttl)
+        return self.cache_ttl
+
+    @staticmethod
+    def _extract_html_text(html: bytes) -> str:
+        """Extracts readable text from an HTML document."""
+        soup = BeautifulSoup(html, 'html.parser')
+        for script_or_style in soup(['script', 'style']):
+            script_or_style.decompose()
+        text = soup.get_text()
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return '\n'.join(chunk for chunk in chunks if chunk)
+
     def fetch_url_content(self, url: str) -> str | None:
         """
         Fetches the main text content from a given URL.
+        Results are cached in memory per URL (LRU with TTL).
+        Plain text and JSON are returned as-is; other non-HTML content
+        (PDFs, images, ...) and oversized bodies are skipped and return None.
         """
         try:
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            for script_or_style in soup(['script', 'style']):
-                script_or_style.decompose()
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            with self._cache_lock:
+                cached = self._cache.get(url)
+            if cached is not None:
+                return cached
+            with requests.get(url, headers=self.headers, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                content_length = response.headers.get('Content-Length', '')
+                if content_length.isdigit() and int(content_length) > self.max_content_length:
+                    logger.debug(f"Skipping {url}: content too large ({content_length} bytes)")
+                    return None
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                if content_type in self._PLAIN_TEXT_TYPES:
+                    text = response.text
+                elif content_type and content_type not in self._HTML_TYPES:
+                    # PDF、圖片等非 HTML 內容不交給 BeautifulSoup 解析
+                    logger.debug(f"Skipping {url}: unsupported content type '{content_type}'")
+                    return None
+                else:
+                    text = self._extract_html_text(response.content)
+                ttl = self._cache_ttl(response)
+            if ttl > 0:
+                with self._cache_lock:
+                    self._cache.set(url, text, ex=ttl)
             return text
         except requests.RequestException as e:
             logger.error(f"Error fetching URL {url}: {e}")
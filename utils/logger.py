@@ -3,9 +3,13 @@
 提供統一、可擴展的日誌記錄功能，支援多模組、可自訂等級與格式。
 """
 
+import atexit
+import functools
 import logging
+import logging.handlers
 import sys
-from typing import Optional
+import threading
+from typing import List, Optional
 
 # 新的、更詳細的日誌格式
 DETAILED_LOG_FORMAT = (
@@ -14,6 +18,39 @@ DETAILED_LOG_FORMAT = (
 )
 DEFAULT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
+# 根記錄器批次輸出設定：暫存筆數與最長滯留秒數
+MEMORY_HANDLER_CAPACITY = 1024
+MEMORY_HANDLER_MAX_DELAY = 1.0
+
+
+class _SharedHandler(logging.StreamHandler):
+    """
+    各模組記錄器共用的 handler。
+    根記錄器啟用批次輸出後，紀錄改交給同一個批次 handler，與根記錄器的紀錄維持原本順序。
+    """
+
+    def __init__(self) -> None:
+        super().__init__(sys.stdout)
+        self.batch: Optional[logging.Handler] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.batch is not None:
+            self.batch.handle(record)
+        else:
+            super().emit(record)
+
+
+# 所有記錄器共用同一個 formatter 與 handler，避免每個模組各自配置一份
+_FORMATTER = logging.Formatter(DETAILED_LOG_FORMAT, datefmt=DEFAULT_DATE_FORMAT)
+_SHARED_HANDLER = _SharedHandler()
+_SHARED_HANDLER.setFormatter(_FORMATTER)
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_level(level_str: str) -> int:
+    """將日誌等級字串轉為 logging 常數，無法辨識時回傳 INFO。"""
+    return getattr(logging, level_str.upper(), logging.INFO)
+
 
 def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     """
@@ -30,33 +67,96 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     logger = logging.getLogger(name)
     if logger.handlers:
         return logger
-    log_level: int = getattr(logging, (level or 'INFO').upper(), logging.INFO)
-    logger.setLevel(log_level)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
-    formatter = logging.Formatter(
-        DETAILED_LOG_FORMAT,  # 使用新的詳細格式
-        datefmt=DEFAULT_DATE_FORMAT)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    logger.setLevel(_parse_level(level or 'INFO'))
+    # 共用 handler 不設定等級，由各記錄器自身的等級負責過濾
+    logger.addHandler(_SHARED_HANDLER)
     logger.propagate = False
     return logger
 
 
+class _BatchedStreamHandler(logging.StreamHandler):
+    """
+    將一批紀錄串接後以單次 write 寫入 sys.stdout。
+    直接寫入 sys.stdout 而非另建緩衝層，與 print() 及 PYTHONUNBUFFERED 的行為一致。
+    """
+
+    def emit_batch(self, records: List[logging.LogRecord]) -> None:
+        chunks = []
+        for record in records:
+            if not self.filter(record):
+                continue
+            try:
+                chunks.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not chunks:
+            return
+        self.acquire()
+        try:
+            self.stream.write(''.join(chunks))
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class _BatchingMemoryHandler(logging.handlers.MemoryHandler):
+    """
+    暫存日誌紀錄並批次交給 target 輸出。
+    除了筆數上限與 flushLevel 外，背景執行緒每 max_delay 秒也會送出暫存的紀錄，
+    避免低流量時日誌長時間看不到（即使之後沒有新紀錄進來）。
+    """
+
+    def __init__(self, capacity: int, flushLevel: int,
+                 target: _BatchedStreamHandler, max_delay: float) -> None:
+        super().__init__(capacity, flushLevel=flushLevel, target=target)
+        self.max_delay = max_delay
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name='log-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop.wait(self.max_delay):
+            if self.buffer:
+                self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.target and self.buffer:
+                self.target.emit_batch(self.buffer)
+                self.buffer.clear()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self._stop.set()
+        super().close()
+
+
 def setup_root_logger(level: str = 'INFO') -> None:
     """
     設定根日誌記錄器，建議於應用啟動時呼叫一次。
+    INFO 等一般紀錄會批次輸出，WARNING 以上則立即送出。
+    get_logger 取得的模組記錄器也改經同一個批次 handler，所有紀錄維持寫入順序。
 
     Args:
         level (str): 日誌等級 (DEBUG, INFO, WARNING, ERROR, CRITICAL)。
     """
+    if logging.getLogger().handlers:
+        return
+    stream_handler = _BatchedStreamHandler(sys.stdout)
+    stream_handler.setFormatter(_FORMATTER)
+    handler = _BatchingMemoryHandler(
+        MEMORY_HANDLER_CAPACITY,
+        flushLevel=logging.WARNING,
+        target=stream_handler,
+        max_delay=MEMORY_HANDLER_MAX_DELAY)
     logging.basicConfig(
-        level=getattr(
-            logging,
-            level.upper(),
-            logging.INFO),
-        format=DETAILED_LOG_FORMAT,  # 使用新的詳細格式
-        datefmt=DEFAULT_DATE_FORMAT,
-        handlers=[
-            logging.StreamHandler(
-                sys.stdout)])
+        level=_parse_level(level),
+        handlers=[handler])
+    _SHARED_HANDLER.batch = handler
+    # 程式結束前送出尚未輸出的紀錄
+    atexit.register(handler.flush)
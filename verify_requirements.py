@@ -7,6 +7,7 @@ import subprocess
 import sys
 import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 def check_requirements():
     """檢查 requirements.txt 中的所有套件是否可以安裝"""
@@ -35,6 +36,13 @@ def check_requirements():
         print(f"❌ 檢查過程發生錯誤: {e}")
         return False
 
+def _dry_run_install(packages, timeout):
+    """以 pip dry-run 檢查套件是否可安裝，回傳 subprocess 結果"""
+    return subprocess.run([
+        sys.executable, '-m', 'pip', 'install',
+        '--dry-run', '--quiet', *packages
+    ], capture_output=True, text=True, timeout=timeout)
+
 def check_critical_packages():
     """檢查關鍵套件的可用性"""
     critical_packages = [
@@ -47,24 +55,43 @@ def check_critical_packages():
     
     print("\n🎯 檢查關鍵套件...")
     
-    for package in critical_packages:
+    # 一次呼叫 pip 檢查全部套件，只需付出一次 pip 啟動與解析成本
+    try:
+        result = _dry_run_install(critical_packages, timeout=90)
+    except Exception as e:
+        print(f"❌ 關鍵套件檢查失敗: {e}")
+        return False
+
+    if result.returncode == 0:
+        for package in critical_packages:
+            print(f"✅ {package}")
+        return True
+
+    # 批次檢查失敗時，平行逐一檢查以找出有問題的套件
+    print("⚠️ 批次檢查失敗，正在逐一確認問題套件...")
+
+    def check_one(package):
         try:
-            result = subprocess.run([
-                sys.executable, '-m', 'pip', 'install', 
-                '--dry-run', '--quiet', package
-            ], capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
+            return package, _dry_run_install([package], timeout=30)
+        except Exception as e:
+            return package, e
+
+    all_ok = True
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for package, outcome in executor.map(check_one, critical_packages):
+            if isinstance(outcome, Exception):
+                print(f"❌ {package} - 檢查失敗: {outcome}")
+                all_ok = False
+            elif outcome.returncode == 0:
                 print(f"✅ {package}")
             else:
-                print(f"❌ {package} - {result.stderr.strip()}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ {package} - 檢查失敗: {e}")
-            return False
-    
-    return True
+                print(f"❌ {package} - {outcome.stderr.strip()}")
+                all_ok = False
+
+    if all_ok:
+        # 個別皆可安裝，代表是套件之間的相依衝突
+        print(f"❌ 套件組合存在相依衝突 - {result.stderr.strip()}")
+    return False
 
 def main():
     """主函數"""
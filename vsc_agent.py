@@ -4,133 +4,759 @@
 # vsc_agent_pro.py: Final stable version using verified models.
 
 
+import asyncio
+import atexit
 import os
 import sys
 import datetime
 import difflib
+import functools
+import hashlib
 import json
 import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 try:
     import vertexai
-    from vertexai.generative_models import GenerativeModel
+    from vertexai.generative_models import GenerativeModel, Part
 except ImportError:
     print("\n[錯誤] 缺少必要的 'google-cloud-aiplatform' 套件。")
     print("請在您的終端機中，啟用 venv 後執行：pip3 install -r requirements.txt\n")
     sys.exit(1)
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:  # orjson 為選用套件，未安裝時使用標準函式庫
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+try:
+    from cdifflib import CSequenceMatcher as _SequenceMatcher
+except ImportError:  # cdifflib 為選用的 C 實作，未安裝時使用標準函式庫
+    _SequenceMatcher = difflib.SequenceMatcher
+
+try:
+    import readline
+except ImportError:  # Windows 沒有 readline，只是少了指令歷史與行內編輯
+    readline = None
+
+try:
+    import termios
+except ImportError:  # 非 POSIX 平台沒有 termios，也沒有需要還原的終端機模式
+    termios = None
+
+# 根據您的要求，設定模型名稱
+MODEL_NAME = "gemini-2.5-flash"
+CACHE_DIR = Path.home() / ".cache" / "vsc_agent"
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# 記憶體中保留的最近 AI 回應筆數，命中時連磁碟讀取與 JSON 解析都省去
+MEMORY_CACHE_SIZE = 512
+# 同時進行中的 Gemini 請求上限，避免超出 Vertex AI 配額
+MAX_CONCURRENT_REQUESTS = 8
+# 規劃結果只有少數小檔案時，合併為單一請求，避免重複傳送相同的指示與需求
+FUSED_MAX_FILES = 3
+FUSED_MAX_CHARS = 20 * 1024
+# 指令歷史紀錄檔與保留筆數
+HISTORY_FILE = Path.home() / ".vsc_agent_history"
+HISTORY_LENGTH = 1000
+
+# 提示可為單一字串，或多段文字（分別以 Part 送出，避免先串接成一個巨大字串）
+Prompt = Union[str, Sequence[str]]
+
 # --- Helper Functions ---
 
 
+_COLOR_PREFIX = {code: f"\033[{code}m" for code in ("31", "32", "33", "34", "35", "36", "94")}
+_RESET = "\033[0m\n"
+_DIFF_ADDED = _COLOR_PREFIX["32"]
+_DIFF_REMOVED = _COLOR_PREFIX["31"]
+_DIFF_MARKER = _COLOR_PREFIX["34"]
+# diff 行的顏色只取決於第一個字元
+_DIFF_COLOR_BY_FIRST = {'+': _DIFF_ADDED, '-': _DIFF_REMOVED, '^': _DIFF_MARKER}
+
+
+def _color_prefix(color_code: str) -> str:
+    prefix = _COLOR_PREFIX.get(color_code)
+    if prefix is None:
+        prefix = _COLOR_PREFIX[color_code] = f"\033[{color_code}m"
+    return prefix
+
+
 def print_color(text: str, color_code: str) -> None:
     """彩色輸出訊息。"""
-    print(f"\033[{color_code}m{text}\033[0m")
+    sys.stdout.write(_color_prefix(color_code) + text + _RESET)
+
+
+# 啟動時的終端機屬性；readline 在背景執行緒中等待輸入時會關閉回顯，Ctrl-C 離開後須還原
+_saved_tty_attrs: Optional[list] = None
+
+
+def _restore_terminal() -> None:
+    """還原啟動時的終端機屬性（回顯與行緩衝）。"""
+    if _saved_tty_attrs is None:
+        return
+    try:
+        termios.tcsetattr(sys.stdin, termios.TCSADRAIN, _saved_tty_attrs)
+    except (termios.error, OSError, ValueError):
+        pass
+
+
+def setup_history() -> None:
+    """啟用 readline 指令歷史：載入上次的紀錄，並於程式結束時寫回。"""
+    global _saved_tty_attrs
+    if readline is None:
+        return
+    if termios is not None and sys.stdin.isatty():
+        try:
+            _saved_tty_attrs = termios.tcgetattr(sys.stdin)
+        except termios.error:
+            pass
+        else:
+            atexit.register(_restore_terminal)
+    # 只記錄專案級指令，y/n 確認與提交說明不進入歷史（由 ainput 手動加入）
+    readline.set_auto_history(False)
+    readline.set_history_length(HISTORY_LENGTH)
+    try:
+        readline.read_history_file(HISTORY_FILE)
+    except OSError:
+        pass
+
+    def _save() -> None:
+        try:
+            readline.write_history_file(HISTORY_FILE)
+        except OSError:
+            pass
+    atexit.register(_save)
+
+
+async def ainput(prompt: str = "", remember: bool = False) -> str:
+    """
+    在背景執行緒中等待使用者輸入，不阻塞事件迴圈。
+    使用 daemon 執行緒，程式結束時不需等待尚未完成的輸入。
+    Args:
+        prompt (str): 提示文字。
+        remember (bool): 是否將輸入加入 readline 指令歷史。
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future = loop.create_future()
+    # print_color 不會逐次 flush，等待輸入前先送出所有尚在緩衝區的訊息
+    sys.stdout.flush()
+
+    def _read() -> None:
+        try:
+            result = input(prompt)
+        except BaseException as e:  # EOFError 等例外交回事件迴圈處理
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            if remember and readline is not None and result.strip():
+                readline.add_history(result)
+            loop.call_soon_threadsafe(future.set_result, result)
+
+    threading.Thread(target=_read, daemon=True).start()
+    return await future
+
+
+EXCLUDE_DIRS = frozenset({'.git', '__pycache__', '.vscode', 'venv', '.venv'})
+EXCLUDE_FILES = frozenset({'.DS_Store', 'vsc_agent.py'})
+# 已知的二進位副檔名：仍列在樹狀結構中，但不嘗試讀取
+_BINARY_EXTENSIONS = frozenset({
+    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico', 'webp', 'pdf', 'zip', 'gz', 'tar',
+    'whl', 'so', 'dll', 'dylib', 'exe', 'pyc', 'mp3', 'mp4', 'woff', 'woff2', 'ttf',
+})
+# 預先建立各層級的縮排字串，走訪時直接取用
+_INDENTS = tuple("    " * i for i in range(64))
+
+
+def _scan(rel_dir: str, level: int, tree_out: List[str], paths_out: List[str]) -> None:
+    """
+    以 os.scandir 遞迴走訪目錄，一次產生樹狀結構行與可讀取的檔案路徑。
+    每個目錄先列出其檔案，再遞迴進入子目錄；DirEntry 自帶檔案類型，不需額外 stat。
+    """
+    indent = _INDENTS[level] if level < len(_INDENTS) else "    " * level
+    sub_dirs: List[str] = []
+    try:
+        it = os.scandir(rel_dir or ".")
+    except OSError:
+        # 無權限讀取的目錄直接略過，不中斷整個掃描
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in EXCLUDE_DIRS:
+                    sub_dirs.append(entry.name)
+            elif entry.name not in EXCLUDE_FILES:
+                tree_out.append(f"{indent}{entry.name}")
+                # 符號連結與二進位檔只列在樹狀結構中，不載入其內容
+                if (entry.is_file(follow_symlinks=False) and
+                        os.path.splitext(entry.name)[1][1:].lower() not in _BINARY_EXTENSIONS):
+                    paths_out.append(os.path.join(rel_dir, entry.name))
+    for name in sub_dirs:
+        tree_out.append(f"{indent}{name}/")
+        _scan(os.path.join(rel_dir, name), level + 1, tree_out, paths_out)
+
+
+def _iter_dirs(rel_dir: str = "", mtime_ns: Optional[int] = None) -> Iterator[Tuple[str, int]]:
+    """
+    走訪專案中所有未排除的目錄（只需讀取目錄，不處理檔案），產生 (路徑, mtime)。
+    子目錄的 mtime 取自 DirEntry；走訪途中被刪除的目錄直接略過。
+    """
+    path = rel_dir or "."
+    if mtime_ns is None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+    yield path, mtime_ns
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if entry.name in EXCLUDE_DIRS:
+                continue
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                sub_mtime = entry.stat(follow_symlinks=False).st_mtime_ns
+            except OSError:
+                continue
+            yield from _iter_dirs(os.path.join(rel_dir, entry.name), sub_mtime)
+
+
+def _tree_fingerprint() -> int:
+    """
+    以所有目錄的 mtime 計算專案結構指紋。
+    目錄的 mtime 只在其中的項目新增、刪除或更名時改變，正好對應樹狀結構的變化。
+    """
+    return hash(tuple(_iter_dirs()))
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_scan(fingerprint: int) -> Tuple[str, Tuple[str, ...]]:
+    tree: List[str] = ["專案根目錄/"]
+    paths: List[str] = []
+    _scan("", 1, tree, paths)
+    return "\n".join(tree), tuple(paths)
+
+
+def scan_project() -> Tuple[str, Tuple[str, ...]]:
+    """
+    單次走訪專案，同時取得目錄樹狀結構與待載入的檔案路徑。
+    結果依目錄 mtime 指紋快取，檔案系統未變動時不重新走訪。
+    Returns:
+        Tuple[str, Tuple[str, ...]]: (樹狀結構文字, 檔案相對路徑)。
+    """
+    return _cached_scan(_tree_fingerprint())
 
 
 def get_project_tree() -> str:
-    """取得專案目錄樹狀結構。"""
-    tree: List[str] = []
-    exclude_dirs = {'.git', '__pycache__', '.vscode', 'venv', '.venv'}
-    exclude_files = {'.DS_Store', 'vsc_agent.py'}
-    for root, dirs, files in os.walk("."):
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        level = root.replace(".", "").count(os.sep)
-        indent = " " * 4 * level
-        base = os.path.basename(root)
-        if level == 0 and base == ".":
-            tree.append("專案根目錄/")
+    """取得專案目錄樹狀結構（檔案系統未變動時使用快取）。"""
+    return scan_project()[0]
+
+
+def _normalize_newlines(text: str) -> str:
+    """與文字模式讀取一致，統一換行字元為 \\n。"""
+    if '\r' not in text:
+        return text
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+class PendingFile:
+    """尚未讀取的檔案，第一次用到時才由磁碟載入。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @functools.cached_property
+    def loaded(self) -> Optional[str]:
+        """讀取結果；無法讀取、非 UTF-8 或為二進位檔時為 None。"""
+        result = _read_one(self.path)
+        return result[1] if result else None
+
+
+FileValue = Union[str, PendingFile]
+
+
+class FileContents:
+    """
+    檔案路徑對應內容的映射。啟動時只記錄路徑（PendingFile），讀取該鍵時才由磁碟載入。
+    copy() 只複製映射本身，PendingFile 在副本間共用，因此同一檔案只會讀取、解碼一次。
+    刻意不提供迭代與長度：未載入的路徑要讀取後才知道能否編輯，列舉結果會與 `in` 判斷不一致。
+    """
+
+    def __init__(self, data: Optional[Dict[str, FileValue]] = None) -> None:
+        self._data: Dict[str, FileValue] = dict(data or {})
+
+    @staticmethod
+    def _resolve(value: Optional[FileValue]) -> Optional[str]:
+        """取出實際內容；無法讀取、非 UTF-8 或為二進位檔時為 None。"""
+        if isinstance(value, PendingFile):
+            return value.loaded
+        return value
+
+    def __getitem__(self, path: str) -> str:
+        text = self._resolve(self._data[path])
+        if text is None:
+            raise KeyError(path)
+        return text
+
+    def __setitem__(self, path: str, content: FileValue) -> None:
+        self._data[path] = content
+
+    def __contains__(self, path: object) -> bool:
+        # 尚未讀取的檔案需實際載入才知道是否可編輯
+        return self._resolve(self._data.get(path)) is not None
+
+    def copy(self) -> "FileContents":
+        return FileContents(self._data)
+
+    def untracked(self, paths: Sequence[str]) -> List[str]:
+        """回傳尚未記錄的路徑（啟動後才新增的檔案），不論其內容能否讀取。"""
+        return [path for path in paths if path not in self._data]
+
+
+# 內容雜湊 -> 字串；內容相同的檔案（空的 __init__.py、相同的設定檔等）共用同一個字串物件
+_content_pool: Dict[bytes, str] = {}
+
+
+def _intern(text: str) -> str:
+    """依內容雜湊取回共用的字串物件，重複的檔案內容只保留一份。"""
+    digest = hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).digest()
+    return _content_pool.setdefault(digest, text)
+
+
+def _read_one(path: str) -> Optional[Tuple[str, str]]:
+    """讀取單一檔案內容，無法讀取、非 UTF-8 或含有 NUL 字元（二進位檔）時回傳 None。"""
+    try:
+        # 不經過 BufferedReader/TextIOWrapper，一次讀入位元組後自行解碼
+        with open(path, 'rb', buffering=0) as f_content:
+            data = f_content.readall()
+        # 在解碼前先檢查 NUL：二進位檔不必白白解碼
+        if b"\0" in data:
+            return None
+        return path, _intern(_normalize_newlines(data.decode('utf-8')))
+    except (OSError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def load_files(paths: Sequence[str]) -> FileContents:
+    """
+    建立延遲載入的檔案內容映射：只記錄路徑，檔案在第一次用到時才讀取。
+    每次指令通常只會動到少數檔案，啟動時不必讀取整個專案。
+    無法讀取或非 UTF-8 的檔案在用到時視為不存在。
+    """
+    return FileContents({path: PendingFile(path) for path in paths})
+
+
+_write_executor = ThreadPoolExecutor(max_workers=8)
+
+
+def atomic_write(path: str, content: str) -> None:
+    """
+    先寫入同目錄下的暫存檔再以 os.replace 取代原檔，避免中途失敗留下寫到一半的檔案。
+    會保留原檔的權限位元（例如可執行的 shell script）。
+    """
+    directory = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory,
+                                     suffix='.tmp', delete=False) as tmp:
+        tmp.write(content)
+    try:
+        if os.path.exists(path):
+            shutil.copymode(path, tmp.name)
+        os.replace(tmp.name, path)
+    except OSError:
+        os.unlink(tmp.name)
+        raise
+
+
+def _format_range(start: int, stop: int) -> str:
+    """依 unified diff 格式輸出 hunk 範圍（與 difflib 相同的規則）。"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _lines(text: str) -> List[str]:
+    """
+    只以 \\n 切分行（不含換行字元）。
+    str.splitlines 還會在 \\x0c、\\x1c-\\x1e、\\x85、\\u2028 等字元處斷行，
+    套用修改時會把這些字元改寫成 \\n，行號也會與模型看到的不一致。
+    """
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def _split_lines(text: str) -> Tuple[str, ...]:
+    """
+    以 \\n 切分並保留換行字元（不快取：快取會讓整份檔案內容在工作階段中一直留在記憶體）。
+    """
+    lines = [line + '\n' for line in text.split('\n')]
+    last = lines.pop()
+    if last != '\n':
+        lines.append(last[:-1])
+    return tuple(lines)
+
+
+def get_diff(original: str, modified: str, filename: str = "", context: int = 3) -> str:
+    """
+    取得兩份檔案內容的 diff。
+    直接走訪 SequenceMatcher 的 grouped opcodes 組出 unified diff。
+    關閉 autojunk：大型檔案中常見的空白行若被當成雜訊略過，比對結果會錯位，
+    審閱用的 diff 以正確為優先。內容相同時直接回傳空字串，不進行比對。
+    """
+    if original is modified or original == modified:
+        return ""
+    orig_lines = _split_lines(original)
+    mod_lines = _split_lines(modified)
+    matcher = _SequenceMatcher(None, orig_lines, mod_lines, autojunk=False)
+    out: List[str] = []
+
+    def emit(prefix: str, lines: Sequence[str]) -> None:
+        for line in lines:
+            out.append(prefix + line)
+            if not line.endswith('\n'):
+                # 檔尾沒有換行時補上標記，避免與下一行黏在一起
+                out.append("\n\\ No newline at end of file\n")
+
+    for group in matcher.get_grouped_opcodes(context):
+        if not out:
+            out.append(f"--- a/{filename}\n")
+            out.append(f"+++ b/{filename}\n")
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                emit(' ', orig_lines[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                emit('-', orig_lines[i1:i2])
+            if tag in ('replace', 'insert'):
+                emit('+', mod_lines[j1:j2])
+    return "".join(out)
+
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+def _parse_hunks(diff_text: str) -> Tuple[List[Tuple[int, List[str], List[str]]], Set[str]]:
+    """
+    將 unified diff 解析為 (原始起始行, 舊行列表, 新行列表) 的 hunk 清單。
+    另外回傳出現 "\\ No newline at end of file" 標記的一側（'-' 為原始、'+' 為修改後）。
+    """
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    current: Optional[Tuple[int, List[str], List[str]]] = None
+    no_newline: Set[str] = set()
+    previous = ''
+    for line in _lines(diff_text.replace('\r\n', '\n')):
+        header = _HUNK_HEADER_RE.match(line)
+        if header:
+            current = (int(header.group(1)), [], [])
+            hunks.append(current)
+        elif current is None:
+            # hunk 之前的檔頭（---/+++）
+            continue
+        elif line.startswith('\\'):
+            # 標記緊接在哪一種行之後，就代表哪一側的檔尾沒有換行
+            no_newline.update(('-', '+') if previous == ' ' else (previous,))
+        elif line.startswith('-'):
+            current[1].append(line[1:])
+            previous = '-'
+        elif line.startswith('+'):
+            current[2].append(line[1:])
+            previous = '+'
         else:
-            tree.append(f"{indent}{base}/")
-        sub_indent = " " * 4 * (level + 1)
-        for f in files:
-            if f not in exclude_files:
-                tree.append(f"{sub_indent}{f}")
-    return "\n".join(tree)
+            # 空白的 context 行常被模型省略開頭的空格
+            text = line[1:] if line.startswith(' ') else line
+            current[1].append(text)
+            current[2].append(text)
+            previous = ' '
+    return hunks, no_newline
 
 
-def get_diff(original: str, modified: str, filename: str = "") -> str:
-    """取得兩份檔案內容的 diff。"""
-    diff_lines = difflib.unified_diff(
-        original.splitlines(keepends=True),
-        modified.splitlines(keepends=True),
-        fromfile=f"a/{filename}",
-        tofile=f"b/{filename}"
-    )
-    return "".join(diff_lines)
+def _find_block(lines: List[str], block: List[str], start: int, hint: int) -> int:
+    """在 lines[start:] 中尋找 block，優先選擇最接近 hint 的位置；找不到回傳 -1。"""
+    if not block:
+        return max(start, min(hint, len(lines)))
+    candidates = [
+        i for i in range(start, len(lines) - len(block) + 1)
+        if lines[i:i + len(block)] == block
+    ]
+    if not candidates:
+        return -1
+    return min(candidates, key=lambda i: abs(i - hint))
+
+
+def apply_unified_diff(original: str, diff_text: str) -> Optional[str]:
+    """
+    將 unified diff 套用到原始內容。
+    以 context 內容定位每個 hunk（容許模型給出的行號有誤差）。
+    Args:
+        original (str): 原始內容。
+        diff_text (str): unified diff 文字。
+    Returns:
+        Optional[str]: 套用後內容；任一 hunk 無法對應時回傳 None。
+    """
+    hunks, no_newline = _parse_hunks(diff_text)
+    if not hunks:
+        return None
+    lines = _lines(original)
+    result: List[str] = []
+    cursor = 0
+    for old_start, old_block, new_block in hunks:
+        pos = _find_block(lines, old_block, cursor, old_start - 1)
+        if pos == -1:
+            return None
+        result.extend(lines[cursor:pos])
+        result.extend(new_block)
+        cursor = pos + len(old_block)
+    result.extend(lines[cursor:])
+    if not result:
+        return ""
+    # 檔尾換行沿用原始內容，除非 diff 以標記明確表示修改後的檔尾有無換行
+    if '+' in no_newline:
+        trailing_newline = ""
+    elif '-' in no_newline or original.endswith("\n") or not original:
+        trailing_newline = "\n"
+    else:
+        trailing_newline = ""
+    return "\n".join(result) + trailing_newline
 
 
 def print_diff(diff_text: str) -> None:
     """彩色顯示 diff 內容。"""
-    for line in diff_text.splitlines():
-        if line.startswith('+'):
-            print_color(line, "32")
-        elif line.startswith('-'):
-            print_color(line, "31")
-        elif line.startswith('^'):
-            print_color(line, "34")
-        else:
-            print(line)
+    out: List[str] = []
+    for line in _lines(diff_text):
+        prefix = _DIFF_COLOR_BY_FIRST.get(line[:1])
+        out.append(prefix + line + _RESET if prefix else line + "\n")
+    # 整份 diff 組成單一字串後一次寫出並 flush，避免逐行寫入
+    sys.stdout.write("".join(out))
+    sys.stdout.flush()
+
+
+def run_command(cmd_list: List[str]) -> subprocess.CompletedProcess:
+    """
+    直接以參數列表執行外部指令（不經過 shell）。
+    Args:
+        cmd_list (List[str]): 指令與參數。
+    Returns:
+        subprocess.CompletedProcess: 執行結果。
+    Raises:
+        subprocess.CalledProcessError: 指令以非零狀態結束時。
+    """
+    result = subprocess.run(cmd_list, capture_output=True, text=True, check=True)
+    if result.stdout.strip():
+        print(result.stdout.rstrip())
+    # git push 的進度與建立 PR 的網址提示都寫在 stderr，成功時也要顯示
+    if result.stderr.strip():
+        print(result.stderr.rstrip())
+    return result
 
 
 def git_push_changes(branch_name: str, file_paths: List[str], commit_message: str) -> bool:
     """將變更推送到 GitHub 新分支。"""
     try:
         print_color(f"正在建立新分支: {branch_name}...", "36")
-        os.system(f"git checkout -b {branch_name}")
+        run_command(["git", "checkout", "-b", branch_name])
         print_color("正在將變更加入暫存區...", "36")
-        os.system(f"git add {' '.join(f'\"{path}\"' for path in file_paths)}")
+        run_command(["git", "add", "--", *file_paths])
         print_color("正在提交變更...", "36")
-        os.system(f"git commit -m \"{commit_message}\"")
+        run_command(["git", "commit", "-m", commit_message])
         print_color("正在推送至 GitHub...", "36")
-        os.system(f"git push -u origin {branch_name}")
+        run_command(["git", "push", "-u", "origin", branch_name])
         return True
-    except Exception as e:
+    except subprocess.CalledProcessError as e:
+        print_color(f"❌ 指令執行失敗 ({' '.join(e.cmd)}): {(e.stderr or '').strip()}", "31")
+        return False
+    except OSError as e:
         print_color(f"❌ 推送至 GitHub 時發生錯誤: {e}", "31")
         return False
 
 # --- AI Interaction Functions ---
 
 
-def get_ai_response(prompt_text: str, expect_json: bool = False) -> Any:
+def _response_cache_path(prompt_text: Prompt, expect_json: bool) -> Path:
+    """以模型名稱、回應格式與提示內容的 BLAKE2b 雜湊決定快取檔案位置。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{MODEL_NAME}\0{int(expect_json)}\0".encode())
+    if isinstance(prompt_text, str):
+        digest.update(prompt_text.encode())
+    else:
+        for part in prompt_text:
+            digest.update(b"\0part\0")
+            digest.update(part.encode())
+    return CACHE_DIR / f"{digest.hexdigest()}.json"
+
+
+# 以快取檔名為鍵的 (寫入時間, 回應) LRU，位於磁碟快取之前
+_memory_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+
+def _remember(key: str, ts: float, result: Any) -> None:
+    """將回應放入記憶體 LRU，超過 MEMORY_CACHE_SIZE 時淘汰最久未使用的項目。"""
+    _memory_cache[key] = (ts, result)
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def disk_cached(func):
+    """
+    將 AI 回應快取於磁碟，相同提示再次詢問時直接讀取結果而不呼叫 API。
+    最近使用的回應另外保留在記憶體 LRU 中，先查記憶體再查磁碟。
+    回應為 None（呼叫或解析失敗）時不寫入快取。
+    """
+    @functools.wraps(func)
+    async def wrapper(prompt_text: Prompt, expect_json: bool = False,
+                      on_chunk: Optional[Callable[[str], None]] = None) -> Any:
+        cache_file = _response_cache_path(prompt_text, expect_json)
+        key = cache_file.name
+        hit = _memory_cache.get(key)
+        if hit is not None:
+            if time.time() - hit[0] < CACHE_TTL_SECONDS:
+                _memory_cache.move_to_end(key)
+                print_color("⚡ 使用快取的 AI 回應。", "36")
+                return hit[1]
+            del _memory_cache[key]
+        try:
+            entry = _json_loads(cache_file.read_bytes())
+            if time.time() - entry["ts"] < CACHE_TTL_SECONDS:
+                _remember(key, entry["ts"], entry["result"])
+                print_color("⚡ 使用快取的 AI 回應。", "36")
+                return entry["result"]
+            cache_file.unlink(missing_ok=True)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        result = await func(prompt_text, expect_json, on_chunk)
+        if result is not None:
+            _remember(key, time.time(), result)
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                # 先寫入暫存檔再以 os.replace 原子性地取代，避免留下寫到一半的快取
+                with tempfile.NamedTemporaryFile('wb', dir=CACHE_DIR,
+                                                 suffix='.tmp', delete=False) as tmp:
+                    tmp.write(_json_dumps({"result": result, "ts": time.time()}))
+                os.replace(tmp.name, cache_file)
+            except OSError as e:
+                print_color(f"⚠️  寫入 AI 回應快取失敗: {e}", "33")
+        return result
+    return wrapper
+
+
+def clear_response_cache() -> int:
+    """
+    清除所有快取的 AI 回應。
+    Returns:
+        int: 刪除的快取檔案數量。
+    """
+    _memory_cache.clear()
+    removed = 0
+    for cache_file in CACHE_DIR.glob("*.json"):
+        try:
+            cache_file.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+_JSON_FENCE_RE = re.compile(r"```json\s*([\s\S]+?)\s*```")
+# 整段回應被包在 ```diff、```patch 或無標籤的程式碼區塊中
+_DIFF_FENCE_RE = re.compile(r"```[\w+-]*[ \t]*\n([\s\S]*?)\n?```")
+_request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def _extract_json(text: str) -> Optional[str]:
+    """
+    單次由左至右掃描，取出第一個完整的 JSON 物件或陣列。
+    追蹤括號深度與字串內的跳脫字元，字串中的括號不影響配對。
+    Returns:
+        Optional[str]: JSON 片段；找不到或括號未閉合時為 None。
     """
-    與 AI 互動取得回應。
+    start = -1
+    depth = 0
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch in '{[':
+            if start == -1:
+                start = i
+            depth += 1
+        elif ch in '}]' and start != -1:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        elif ch == '"' and start != -1:
+            in_string = True
+    return None
+
+
+@disk_cached
+async def get_ai_response(prompt_text: Prompt, expect_json: bool = False,
+                          on_chunk: Optional[Callable[[str], None]] = None) -> Any:
+    """
+    與 AI 非同步互動取得回應，同時進行的請求數受 MAX_CONCURRENT_REQUESTS 限制。
     Args:
-        prompt_text (str): 輸入提示。
+        prompt_text (Prompt): 輸入提示；多段文字時每段以獨立的 Part 送出。
         expect_json (bool): 是否預期回傳 JSON。
+        on_chunk (Optional[Callable[[str], None]]): 每收到一段串流文字即呼叫，
+            使用快取的回應時不會呼叫。
     Returns:
         Any: 回應內容。
     """
     try:
-        if expect_json:
-            responses = model.generate_content(prompt_text, stream=True)
-            output = "".join([response.text for response in responses])
+        if isinstance(prompt_text, str):
+            contents: Any = prompt_text
         else:
-            response = model.generate_content(prompt_text)
-            output = response.text
+            contents = [Part.from_text(part) for part in prompt_text]
+        async with _request_semaphore:
+            # 以串流接收回應，片段抵達即累積，不需等待整份回應產生完畢才開始傳輸
+            responses = await model.generate_content_async(contents, stream=True)
+            chunks: List[str] = []
+            async for response in responses:
+                chunks.append(response.text)
+                if on_chunk is not None:
+                    on_chunk(response.text)
+            output = "".join(chunks)
         if expect_json:
-            match = re.search(r"```json\s*([\s\S]+?)\s*```", output)
+            # 多數回應本身就是純 JSON，先直接解析，失敗時才掃描程式碼區塊或括號
+            try:
+                return _json_loads(output.strip())
+            except json.JSONDecodeError:
+                pass
+            match = _JSON_FENCE_RE.search(output)
             if match:
                 cleaned_output = match.group(1).strip()
             else:
-                first_brace = output.find('{')
-                first_bracket = output.find('[')
-                if first_brace == -1:
-                    json_start = first_bracket
-                elif first_bracket == -1:
-                    json_start = first_brace
-                else:
-                    json_start = min(first_brace, first_bracket)
-                if json_start != -1:
-                    json_end = max(output.rfind('}'), output.rfind(']'))
-                    if json_end > json_start:
-                        cleaned_output = output[json_start:json_end + 1]
-                    else:
-                        raise json.JSONDecodeError("在 AI 回應中找不到有效的 JSON 物件。", output, 0)
-                else:
+                cleaned_output = _extract_json(output)
+                if cleaned_output is None:
                     raise json.JSONDecodeError("在 AI 回應中找不到有效的 JSON 物件。", output, 0)
-            return json.loads(cleaned_output)
+            return _json_loads(cleaned_output)
         return output
     except json.JSONDecodeError as e:
         print_color(f"❌ [偵錯] JSON 解析失敗: {e}", "31")
@@ -144,38 +770,108 @@ def get_ai_response(prompt_text: str, expect_json: bool = False) -> Any:
         return None
 
 
-def plan_changes(project_tree: str, user_prompt: str) -> Any:
+async def warm_up_model() -> None:
+    """
+    以不產生內容、不計費的 count_tokens 請求預先完成認證與 gRPC 連線建立，
+    讓第一個真正的請求不必承擔冷啟動延遲。失敗時靜默略過，由實際請求回報錯誤。
+    """
+    try:
+        await model.count_tokens_async("ping")
+    except Exception:
+        pass
+
+
+@functools.lru_cache(maxsize=32)
+def _plan_prompt(project_tree: str, user_prompt: str) -> Tuple[str, ...]:
+    """
+    組出規劃用的提示段落。以 (專案結構, 使用者需求) 快取，重試相同指令時直接取用。
+    專案結構字串本身來自 scan_project 的快取，其雜湊值只需計算一次。
+    """
+    instructions = f"""
+    You are a senior software architect. Your task is to analyze a user's request and a project's file structure, then determine which files need to be read and potentially modified.
+    Based on the user's request: "{user_prompt}", identify the relevant files.
+    If the request specifies a file type (e.g., ".py", ".md"), ONLY include files of that type.
+    Respond with ONLY a JSON array of file paths. Do not include any other text or explanation.
+    """
+    return (instructions, f"File structure:\n{project_tree}", f'User request: "{user_prompt}"')
+
+
+class _JsonStringArrayScanner:
+    """
+    逐段讀入串流中的 JSON 字串陣列，每當最外層陣列的一個字串元素完整出現時即回傳。
+    第一個 '[' 之前的文字（例如 ```json 標記）一律忽略，巢狀物件或陣列中的字串也不回傳。
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        completed: List[str] = []
+        for ch in text:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        try:
+                            completed.append(_json_loads(f'"{"".join(self._current)}"'))
+                        except json.JSONDecodeError:
+                            pass
+                    continue
+                if self._depth == 1:
+                    self._current.append(ch)
+            elif ch == '[' or (ch == '{' and self._depth):
+                self._depth += 1
+            elif ch in ']}' and self._depth:
+                self._depth -= 1
+            elif ch == '"' and self._depth:
+                self._in_string = True
+                self._current = []
+        return completed
+
+
+async def plan_changes(project_tree: str, user_prompt: str,
+                       on_path: Optional[Callable[[str], None]] = None) -> Any:
     """
     根據使用者需求與專案結構規劃需修改的檔案。
     Args:
         project_tree (str): 專案結構。
         user_prompt (str): 使用者需求。
+        on_path (Optional[Callable[[str], None]]): 串流中每解析出一個檔案路徑即呼叫，
+            讓呼叫端在規劃完成前就能開始處理該檔案。
     Returns:
         Any: AI 回傳的檔案路徑清單。
     """
     print_color("🤖 正在分析您的需求並規劃修改範圍...", "36")
-    prompt = f"""
-    You are a senior software architect. Your task is to analyze a user's request and a project's file structure, then determine which files need to be read and potentially modified.
-    Based on the user's request: "{user_prompt}", identify the relevant files.
-    If the request specifies a file type (e.g., ".py", ".md"), ONLY include files of that type.
-    Respond with ONLY a JSON array of file paths. Do not include any other text or explanation.
-    File structure:\n{project_tree}\n\nUser request: "{user_prompt}"
-    """
-    return get_ai_response(prompt, expect_json=True)
+    parts = _plan_prompt(project_tree, user_prompt)
+    on_chunk: Optional[Callable[[str], None]] = None
+    if on_path is not None:
+        scanner = _JsonStringArrayScanner()
+
+        def _feed(text: str) -> None:
+            for path in scanner.feed(text):
+                on_path(path)
+        on_chunk = _feed
+    return await get_ai_response(parts, expect_json=True, on_chunk=on_chunk)
 
 
-def generate_full_modification(file_path: str, file_content: str, user_prompt: str) -> Optional[str]:
+async def generate_full_modification(file_path: str, file_content: str, user_prompt: str) -> Optional[str]:
     """
-    要求 AI 針對單一檔案產生修改後的完整內容。
+    要求 AI 針對單一檔案產生修改後的完整內容（diff 無法套用時的備援模式）。
     Args:
         file_path (str): 檔案路徑。
-        file_content (str): 原始內容。
+        file_content (str): 目前內容。
         user_prompt (str): 使用者需求。
     Returns:
         Optional[str]: 修改後內容。
     """
-    print_color(f"🤖 正在為 {file_path} 產生修改建議...", "36")
-    prompt = f"""
+    instructions = f"""
     You are an expert pair programmer AI assistant. Your task is to modify the single file provided below based on the user's request.
     Your output MUST be ONLY the complete, updated file content. Do NOT use markdown, JSON, or any other formatting.
     Just return the raw code for the file.
@@ -183,33 +879,339 @@ def generate_full_modification(file_path: str, file_content: str, user_prompt: s
     User request: "{user_prompt}"
 
     You are now editing the file: "{file_path}"
-    --- START OF ORIGINAL FILE CONTENT ---
-    {file_content}
-    --- END OF ORIGINAL FILE CONTENT ---
     """
-    return get_ai_response(prompt, expect_json=False)
+    parts = [
+        instructions,
+        f"--- START OF ORIGINAL FILE CONTENT ---\n{file_content}\n--- END OF ORIGINAL FILE CONTENT ---",
+    ]
+    return await get_ai_response(parts, expect_json=False)
+
+
+def _number_lines(content: str) -> str:
+    """為檔案內容加上行號，方便模型產生正確的 hunk 位置。"""
+    return "\n".join(f"{i:>5}| {line}" for i, line in enumerate(_lines(content), 1))
+
+
+async def generate_modification(file_path: str, original_content: str, current_content: str,
+                                user_prompt: str) -> Optional[str]:
+    """
+    要求 AI 以 unified diff 形式提出單一檔案的修改，並於本地套用。
+    只需回傳變更的部分，輸出 token 數與修改幅度成正比，而非與檔案大小成正比。
+    Args:
+        file_path (str): 檔案路徑。
+        original_content (str): 本次工作階段開始時的內容。
+        current_content (str): 目前內容（可能已包含先前接受的修改）。
+        user_prompt (str): 使用者需求。
+    Returns:
+        Optional[str]: 修改後內容；AI 無回應時為 None。
+    """
+    print_color(f"🤖 正在為 {file_path} 產生修改建議...", "36")
+    prior_diff = get_diff(original_content, current_content, file_path)
+    instructions = f"""
+    You are an expert pair programmer AI assistant. Your task is to modify the single file provided below based on the user's request.
+    Your output MUST be ONLY a unified diff (with "--- a/{file_path}" and "+++ b/{file_path}" headers and "@@" hunk headers) against the current file content.
+    Include 3 lines of unchanged context around each change. Do NOT use markdown, JSON, or any other formatting.
+    If no change is needed, return an empty response.
+
+    User request: "{user_prompt}"
+
+    You are now editing the file: "{file_path}"
+    """
+    parts = [instructions]
+    if prior_diff:
+        parts.append(
+            "Changes already applied to this file earlier in this session:\n"
+            f"--- START OF PRIOR CHANGES ---\n{prior_diff}--- END OF PRIOR CHANGES ---")
+    parts.append(
+        'The current file content is shown below with line numbers ("LINE| content"); '
+        "the line numbers are NOT part of the file.\n"
+        f"--- START OF CURRENT FILE CONTENT ---\n{_number_lines(current_content)}\n"
+        "--- END OF CURRENT FILE CONTENT ---")
+    diff_text = await get_ai_response(parts, expect_json=False)
+    if diff_text is None:
+        return None
+    diff_text = diff_text.strip()
+    fenced = _DIFF_FENCE_RE.fullmatch(diff_text)
+    if fenced:
+        diff_text = fenced.group(1)
+    if not diff_text.strip():
+        return current_content
+    new_content = apply_unified_diff(current_content, diff_text)
+    if new_content is None:
+        print_color(f"⚠️  AI 產生的 diff 無法套用到 {file_path}，改為要求完整檔案內容。", "33")
+        return await generate_full_modification(file_path, current_content, user_prompt)
+    return new_content
+
+
+async def propose_change(file_path: str, original_content: str, current_content: str,
+                         user_prompt: str) -> Tuple[Optional[str], str]:
+    """
+    產生單一檔案的修改建議，並於背景執行緒中先算好相對於目前內容的 diff，
+    使用者審閱前一個檔案時，下一個檔案的比對即可同時進行。
+    Returns:
+        Tuple[Optional[str], str]: (修改後內容, diff)；無修改時 diff 為空字串。
+    """
+    new_content = await generate_modification(file_path, original_content, current_content, user_prompt)
+    if new_content is None or new_content == current_content:
+        return new_content, ""
+    diff = await asyncio.to_thread(get_diff, current_content, new_content, file_path)
+    return new_content, diff
+
+
+def _split_diff_by_file(diff_text: str, file_paths: Sequence[str]) -> Dict[str, str]:
+    """
+    將涵蓋多個檔案的 unified diff 依 "--- a/… / +++ b/…" 標頭拆成各檔案的 diff。
+    只認得 file_paths 中的路徑，避免把被刪除的 "-- " 開頭內容誤判為標頭。
+    """
+    wanted = set(file_paths)
+    sections: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    lines = _split_lines(diff_text.replace('\r\n', '\n'))
+    for i, line in enumerate(lines):
+        if line.startswith('+++ ') and i > 0 and lines[i - 1].startswith('--- '):
+            path = line[4:].strip().removeprefix('b/')
+            if path in wanted:
+                if current is not None:
+                    current.pop()  # 上一行 "--- a/…" 屬於這個檔案的標頭
+                current = sections.setdefault(path, [])
+                current.extend((lines[i - 1], line))
+                continue
+        if current is not None:
+            current.append(line)
+    return {path: "".join(section) for path, section in sections.items()}
+
+
+async def propose_changes_fused(file_paths: Sequence[str], original_contents: FileContents,
+                                current_contents: FileContents,
+                                user_prompt: str) -> Dict[str, Tuple[Optional[str], str]]:
+    """
+    以單一請求為多個小檔案產生修改，回應為涵蓋所有檔案的 unified diff，於本地拆分套用。
+    內容完全相同的檔案只送出一次，模型只需回傳第一個路徑的 diff，其餘路徑沿用同一份 diff。
+    回應失敗、某檔案的 diff 無法套用，或非空的回應中缺少某檔案的段落時，改以 propose_change 逐檔處理。
+    Returns:
+        Dict[str, Tuple[Optional[str], str]]: 各檔案的 (修改後內容, diff)。
+    """
+    print_color(f"🤖 正在以單一請求為 {', '.join(file_paths)} 產生修改建議...", "36")
+    instructions = f"""
+    You are an expert pair programmer AI assistant. Your task is to modify the files provided below based on the user's request.
+    Your output MUST be ONLY a unified diff covering every file you change, each starting with "--- a/<path>" and "+++ b/<path>" headers followed by "@@" hunk headers.
+    Include 3 lines of unchanged context around each change. Omit files that need no change. Do NOT use markdown, JSON, or any other formatting.
+    If no change is needed at all, return an empty response.
+
+    User request: "{user_prompt}"
+    """
+    # 內容 -> 共用該內容的路徑（依序，第一個為代表路徑）
+    groups: Dict[str, List[str]] = {}
+    for file_path in file_paths:
+        groups.setdefault(current_contents[file_path], []).append(file_path)
+    parts = [instructions]
+    for content, paths in groups.items():
+        file_path = paths[0]
+        aliases = ""
+        if len(paths) > 1:
+            others = ", ".join(f'"{alias}"' for alias in paths[1:])
+            aliases = (f"These paths have exactly the same content as \"{file_path}\": {others}. "
+                       f"Return a diff for \"{file_path}\" only; it will be applied to all of them.\n")
+        parts.append(
+            f'File "{file_path}" (shown as "LINE| content"; the line numbers are NOT part of the file):\n'
+            f"{aliases}--- START OF {file_path} ---\n{_number_lines(content)}\n"
+            f"--- END OF {file_path} ---")
+    diff_text = await get_ai_response(parts, expect_json=False)
+    results: Dict[str, Tuple[Optional[str], str]] = {}
+    retry: List[str] = list(file_paths)
+    if diff_text is not None:
+        diff_text = diff_text.strip()
+        fenced = _DIFF_FENCE_RE.fullmatch(diff_text)
+        if fenced:
+            diff_text = fenced.group(1)
+        retry = []
+        file_diffs = _split_diff_by_file(diff_text, file_paths)
+        for paths in groups.values():
+            if paths[0] in file_diffs:
+                for alias in paths[1:]:
+                    file_diffs.setdefault(alias, file_diffs[paths[0]])
+        if diff_text:
+            # 回應有內容卻缺少某檔案的段落，可能是 diff 標頭有誤或被截斷，不能當作不需修改
+            retry.extend(file_path for file_path in file_paths if file_path not in file_diffs)
+        for file_path, file_diff in file_diffs.items():
+            current_content = current_contents[file_path]
+            new_content = apply_unified_diff(current_content, file_diff)
+            if new_content is None:
+                retry.append(file_path)
+            else:
+                diff = await asyncio.to_thread(get_diff, current_content, new_content, file_path)
+                results[file_path] = (new_content, diff)
+    if retry:
+        print_color(f"⚠️  合併請求未能處理 {', '.join(retry)}，改為逐檔請求。", "33")
+        retried = await asyncio.gather(*(
+            propose_change(file_path, original_contents[file_path], current_contents[file_path], user_prompt)
+            for file_path in retry))
+        results.update(zip(retry, retried))
+    for file_path in file_paths:
+        # 模型回傳空白回應時，所有檔案皆不需修改
+        results.setdefault(file_path, (current_contents[file_path], ""))
+    return results
+
+
+async def _fused_result(fused: "asyncio.Task[Dict[str, Tuple[Optional[str], str]]]",
+                        file_path: str) -> Tuple[Optional[str], str]:
+    """取出合併請求中單一檔案的結果；shield 讓取消單一檔案時不會中斷整個合併請求。"""
+    return (await asyncio.shield(fused))[file_path]
 
 # --- Main Agent Logic ---
 
 
-def project_agent():
+def merge_requests(prompts: List[str]) -> str:
+    """將多則獨立的使用者指令合併為單一指令。"""
+    if len(prompts) == 1:
+        return prompts[0]
+    numbered = " ".join(f"{i}) {prompt}" for i, prompt in enumerate(prompts, 1))
+    return f"You will make the following independent edits: {numbered}"
+
+
+async def handle_request(user_input: str, original_contents: FileContents,
+                         current_contents: FileContents, dirty: Set[str]) -> bool:
+    """
+    處理一則使用者指令：規劃修改範圍、產生各檔案的修改建議並逐一審閱套用。
+    Returns:
+        bool: AI 規劃失敗時為 False，否則為 True。
+    """
+    accepted_modifications = {}
+    # --- 化整為零：各檔案的修改建議同時向 AI 請求，依序審閱 ---
+    # 規劃結果仍在串流時，每解析出一個路徑就立即送出該檔案的請求；
+    # 每個檔案的建議一完成即可開始審閱，不必等待所有檔案都產生完畢
+    # 少數小檔案先暫留，規劃完成後合併為單一請求；超過門檻即改為逐檔同時請求
+    proposal_tasks: Dict[str, asyncio.Task] = {}
+    held: List[str] = []
+    fusing = True
+    fused_task: Optional[asyncio.Task] = None
+
+    def start_one(file_path: str) -> None:
+        proposal_tasks[file_path] = asyncio.create_task(propose_change(
+            file_path, original_contents[file_path], current_contents[file_path], user_input))
+
+    def start_proposal(file_path: str) -> None:
+        nonlocal fusing
+        if file_path not in current_contents or file_path in proposal_tasks or file_path in held:
+            return
+        if not fusing:
+            start_one(file_path)
+            return
+        held.append(file_path)
+        if (len(held) > FUSED_MAX_FILES or
+                sum(len(current_contents[path]) for path in held) > FUSED_MAX_CHARS):
+            fusing = False
+            for path in held:
+                start_one(path)
+            held.clear()
+
+    try:
+        project_tree, paths = scan_project()
+        # 啟動後新增的檔案也要能被編輯；兩份映射共用同一個 PendingFile，只讀取一次
+        for path in original_contents.untracked(paths):
+            original_contents[path] = current_contents[path] = PendingFile(path)
+        files_to_edit = await plan_changes(project_tree, user_input, on_path=start_proposal)
+        if not files_to_edit or not isinstance(files_to_edit, list):
+            print_color("🤔 AI 規劃失敗或認為不需修改。", "33")
+            return False
+
+        print_color(f"📝 AI 規劃修改以下檔案: {', '.join(files_to_edit)}\n", "36")
+
+        for file_path in files_to_edit:
+            if file_path not in current_contents:
+                print_color(f"⚠️  警告：規劃修改的檔案 {file_path} 不存在於專案中，已跳過。", "33")
+        # 以完整解析的規劃結果為準：補上串流中未能辨識的路徑，並取消不在結果中的請求
+        files_to_edit = list(dict.fromkeys(
+            file_path for file_path in files_to_edit if file_path in current_contents))
+        for file_path in files_to_edit:
+            start_proposal(file_path)
+        for file_path in proposal_tasks.keys() - set(files_to_edit):
+            proposal_tasks.pop(file_path).cancel()
+        held[:] = [file_path for file_path in held if file_path in files_to_edit]
+        if len(held) > 1:
+            fused_task = asyncio.create_task(propose_changes_fused(
+                held, original_contents, current_contents, user_input))
+            for file_path in held:
+                proposal_tasks[file_path] = asyncio.create_task(_fused_result(fused_task, file_path))
+        elif held:
+            start_one(held[0])
+
+        for i, file_path in enumerate(files_to_edit):
+            print_color(f"--- ({i + 1}/{len(files_to_edit)}) 正在處理: {file_path} ---", "35")
+            new_content, diff = await proposal_tasks[file_path]
+
+            if new_content is None:
+                print_color(f"🤔 AI 未能為 {file_path} 產生有效的修改建議，已跳過。", "33")
+                continue
+
+            if not diff.strip():
+                print_color(f"🤔 AI 認為 {file_path} 無需修改，已跳過。", "33")
+                continue
+
+            print_color("\n" + "=" * 25 + f" 對 {file_path} 的提議變更 " + "=" * 25, "94")
+            print_diff(diff)
+            print_color("=" * 70 + "\n", "94")
+            apply_change = (await ainput(f"是否套用對 {file_path} 的變更？(y/n/q) [yes/no/quit all]: ")).lower()
+
+            if apply_change == 'y':
+                accepted_modifications[file_path] = new_content
+                print_color("✅ 變更已接受並暫存。", "32")
+            elif apply_change == 'q':
+                print_color("🛑 已中止所有後續修改。", "35")
+                break
+            else:
+                print_color(f"⏭️ 已跳過對 {file_path} 的修改。", "36")
+            print("-" * 70)
+    finally:
+        # 中止 (q)、規劃失敗或發生錯誤時，取消尚未完成的請求
+        for task in proposal_tasks.values():
+            task.cancel()
+        if fused_task is not None:
+            fused_task.cancel()
+
+    if accepted_modifications:
+        for file_path, new_content in accepted_modifications.items():
+            current_contents[file_path] = new_content
+            if new_content == original_contents[file_path]:
+                dirty.discard(file_path)
+            else:
+                dirty.add(file_path)
+        # 檔案寫入交給執行緒池平行進行，記憶體中的狀態已於上方同步更新
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(_write_executor, atomic_write, file_path, new_content)
+            for file_path, new_content in accepted_modifications.items()
+        ), return_exceptions=True)
+        failed = False
+        for file_path, result in zip(accepted_modifications, results):
+            if isinstance(result, Exception):
+                failed = True
+                print_color(f"❌ 寫入 {file_path} 失敗: {result}", "31")
+        if not failed:
+            print_color("✅ 所有變更已套用！", "32")
+    else:
+        print_color("操作已取消。", "36")
+    return True
+
+
+async def project_agent():
     global model
     try:
         print_color("正在初始化 Google AI 服務...", "36")
         gcp_project_id = os.getenv("GCP_PROJECT_ID")
         if not gcp_project_id:
-            gcp_project_id = input("🔵 請輸入您的 Google Cloud Project ID: ")
+            gcp_project_id = await ainput("🔵 請輸入您的 Google Cloud Project ID: ")
             if not gcp_project_id:
                 print_color("❌ 未提供 Project ID，程式無法繼續。", "31")
                 sys.exit(1)
 
         vertexai.init(project=gcp_project_id)
-        
-        # 根據您的要求，設定模型名稱
-        model_name = "gemini-2.5-flash"
-        model = GenerativeModel(model_name)
-        
-        print_color(f"✅ Google AI 初始化成功！模型：{model_name}，專案：{gcp_project_id}", "32")
+
+        # 整個工作階段共用同一個模型實例：SDK 會在實例上快取 gRPC 連線，
+        # 之後的規劃與修改請求都重用同一條 HTTP/2 連線，不必每次重新握手
+        model = GenerativeModel(MODEL_NAME)
+
+        print_color(f"✅ Google AI 初始化成功！模型：{MODEL_NAME}，專案：{gcp_project_id}", "32")
     except Exception as e:
         print_color(f"❌ Google AI 初始化失敗: {e}", "31")
         sys.exit(1)
@@ -219,28 +1221,20 @@ def project_agent():
         sys.exit(1)
 
     print_color("🚀 專案級 AI 代理 Pro 已啟動！", "35")
-    project_tree = get_project_tree()
-    original_contents = {}
-    exclude_dirs = {'.git', '__pycache__', '.vscode', 'venv', '.venv'}
-    exclude_files = {'vsc_agent.py'}
-    for root, dirs, files in os.walk("."):
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        for file in files:
-            p = Path(root) / file
-            if p.is_symlink() or str(p) in exclude_files or any(part in exclude_dirs for part in p.parts):
-                continue
-            if p.is_file():
-                try:
-                    with open(p, 'r', encoding='utf-8') as f_content:
-                        original_contents[str(p)] = f_content.read()
-                except (IOError, UnicodeDecodeError):
-                    pass
+    # 背景預熱模型連線，與掃描專案以及使用者輸入第一個指令的時間重疊
+    warm_up = asyncio.create_task(warm_up_model())
+    project_tree, paths = await asyncio.to_thread(scan_project)
+    original_contents = load_files(paths)
 
     current_contents = original_contents.copy()
-    print_color(f"✅ 專案掃描完成，已載入 {len(current_contents)} 個可編輯檔案。", "32")
+    # 與原始內容不同的檔案，套用修改時即時維護，!save 不需重新比對所有檔案
+    dirty: Set[str] = set()
+    pending: List[str] = []
+    print_color(f"✅ 專案掃描完成，共 {len(paths)} 個檔案（用到時才讀取）。", "32")
+    setup_history()
     while True:
         try:
-            user_input = input("🤖 請下達您的專案級指令 (或輸入 !help): ")
+            user_input = await ainput("🤖 請下達您的專案級指令 (或輸入 !help): ", remember=True)
             if not user_input.strip():
                 continue
 
@@ -251,85 +1245,68 @@ def project_agent():
                 print_color("\n--- 可用指令 ---", "33")
                 print("!help   : 顯示此說明")
                 print("!save : 將目前所有修改儲存並推送到 GitHub 的一個新分支")
+                print("!clearcache (!clear-cache) : 清除快取的 AI 回應")
+                print("!queue <指令> : 將指令加入佇列，稍後一次處理")
+                print("!flush : 將佇列中的所有指令合併為一次請求處理")
                 print("!quit   : 退出代理程式")
                 print_color("------------------\n", "33")
                 continue
+            if command.split(maxsplit=1)[0] == "!queue":
+                queued = user_input.strip()[len("!queue"):].strip()
+                if not queued:
+                    print_color("用法：!queue <指令>", "33")
+                    continue
+                pending.append(queued)
+                print_color(f"📥 已加入佇列（目前 {len(pending)} 則），輸入 !flush 一次處理。", "36")
+                continue
+            if command == "!flush":
+                if not pending:
+                    print_color("🤔 佇列中沒有待處理的指令。", "33")
+                    continue
+                batch, pending = pending, []
+                # 多則指令合併為一次規劃與一輪修改，攤提請求與專案結構提示的成本
+                if not await handle_request(merge_requests(batch), original_contents, current_contents, dirty) \
+                        and len(batch) > 1:
+                    print_color("↩️  合併請求規劃失敗，改為逐一處理佇列中的指令。", "33")
+                    for queued in batch:
+                        await handle_request(queued, original_contents, current_contents, dirty)
+                continue
+            if command in ("!clearcache", "!clear-cache"):
+                removed = clear_response_cache()
+                print_color(f"🧹 已清除 {removed} 筆快取的 AI 回應。", "32")
+                continue
             if command == "!save":
-                changed_files = {path: content for path, content in current_contents.items() if original_contents.get(path) != content}
+                # 只需走訪 dirty 集合，不必比對所有檔案內容；排序讓 git add 的順序固定
+                changed_files = sorted(dirty)
                 if not changed_files:
                     print_color("🤔 沒有任何修改可以儲存。", "33")
                     continue
                 branch_name = f"feature/agent-edits-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
-                commit_message = input("請輸入本次提交的說明 (Commit Message): ")
+                commit_message = await ainput("請輸入本次提交的說明 (Commit Message): ")
                 if not commit_message:
                     commit_message = "AI-assisted changes based on user prompt"
-                if git_push_changes(branch_name, list(changed_files.keys()), commit_message):
+                # git 指令在背景執行緒中執行，推送期間事件迴圈仍可處理其他工作（如模型預熱）
+                if await asyncio.to_thread(git_push_changes, branch_name, changed_files, commit_message):
+                    dirty.clear()
                     print_color("\n✅ 成功！已將變更推送至新分支。", "32")
                     break
                 else:
                     print_color("推送失敗，請檢查終端機中的 Git 錯誤訊息。", "31")
                 continue
 
-            files_to_edit = plan_changes(project_tree, user_input)
-            if not files_to_edit or not isinstance(files_to_edit, list):
-                print_color("🤔 AI 規劃失敗或認為不需修改。", "33")
-                continue
-
-            print_color(f"📝 AI 規劃修改以下檔案: {', '.join(files_to_edit)}\n", "36")
-            accepted_modifications = {}
-
-            # --- 化整為零：一次處理一個檔案 ---
-            for i, file_path in enumerate(files_to_edit):
-                print_color(f"--- ({i + 1}/{len(files_to_edit)}) 正在處理: {file_path} ---", "35")
-                if file_path not in current_contents:
-                    print_color(f"⚠️  警告：規劃修改的檔案 {file_path} 不存在於專案中，已跳過。", "33")
-                    continue
-
-                original_file_content = current_contents[file_path]
-                new_content = generate_full_modification(file_path, original_file_content, user_input)
-                
-                if new_content is None:
-                    print_color(f"🤔 AI 未能為 {file_path} 產生有效的修改建議，已跳過。", "33")
-                    continue
-                
-                if new_content == original_file_content:
-                    print_color(f"🤔 AI 認為 {file_path} 無需修改，已跳過。", "33")
-                    continue
-
-                diff = get_diff(original_file_content, new_content, file_path)
-                if not diff.strip():
-                    print_color(f"🤔 AI 認為 {file_path} 無需修改，已跳過。", "33")
-                    continue
-
-                print_color("\n" + "=" * 25 + f" 對 {file_path} 的提議變更 " + "=" * 25, "94")
-                print_diff(diff)
-                print_color("=" * 70 + "\n", "94")
-                apply_change = input(f"是否套用對 {file_path} 的變更？(y/n/q) [yes/no/quit all]: ").lower()
-
-                if apply_change == 'y':
-                    accepted_modifications[file_path] = new_content
-                    print_color("✅ 變更已接受並暫存。", "32")
-                elif apply_change == 'q':
-                    print_color("🛑 已中止所有後續修改。", "35")
-                    break
-                else:
-                    print_color(f"⏭️ 已跳過對 {file_path} 的修改。", "36")
-                print("-" * 70)
-
-            if accepted_modifications:
-                for file_path, new_content in accepted_modifications.items():
-                    current_contents[file_path] = new_content
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-                print_color("✅ 所有變更已套用！", "32")
-            else:
-                print_color("操作已取消。", "36")
-        except KeyboardInterrupt:
-            print_color("\n👋 偵測到中斷指令，正在離開。", "35")
+            # 去除前後空白，只差在空白的相同指令可共用快取的 AI 回應
+            await handle_request(user_input.strip(), original_contents, current_contents, dirty)
+        except EOFError:
             break
         except Exception as e:
             print_color(f"\n❌ 發生未預期的錯誤: {e}", "31")
+    # 預熱尚未完成就離開時不需再等待
+    warm_up.cancel()
 
 
 if __name__ == "__main__":
-    project_agent()
+    try:
+        asyncio.run(project_agent())
+    except KeyboardInterrupt:
+        _restore_terminal()
+        print_color("\n👋 偵測到中斷指令，正在離開。", "35")